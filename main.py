@@ -1,8 +1,11 @@
-import os, asyncio, json, time, threading, random
-from collections import deque
+import os, re, sys, asyncio, time, random, mmap, hashlib, functools, contextlib
+from collections import OrderedDict, deque, namedtuple
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
-import requests, httpx, websockets
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+import httpx, websockets, uvicorn, orjson
 
 load_dotenv()
 
@@ -10,6 +13,11 @@ load_dotenv()
 RPC_WS_URL   = os.getenv("RPC_WS_URL", "wss://api.mainnet-beta.solana.com")
 WS_COMMITMENT = os.getenv("WS_COMMITMENT", "processed")  # processed / confirmed
 DISABLE_WS = os.getenv("DISABLE_WS", "0") == "1"
+# 改用 blockSubscribe：節點直接推送完整 jsonParsed 交易，省掉每筆 getTransaction；節點不支援時自動退回 logsSubscribe
+WS_BLOCK_SUBSCRIBE = os.getenv("WS_BLOCK_SUBSCRIBE", "0") == "1"
+# 單一 frame 上限（bytes，<= 0 不限）：整個區塊的通知比單筆 logs 大得多，block 模式預設放寬
+WS_MAX_SIZE = int(os.getenv("WS_MAX_SIZE", str((32 if WS_BLOCK_SUBSCRIBE else 4) * 1024 * 1024)))
+WS_BUFFER_LIMIT = int(os.getenv("WS_BUFFER_LIMIT", str(2 ** 20)))  # 讀/寫緩衝高水位（websockets 預設僅 64 KiB）
 
 # HTTP 主端點（建議官方），回退端點（建議放 Helius/Alchemy/QuickNode 等可保證 JSON 的服務）
 RPC_HTTP_URL = os.getenv("RPC_HTTP_URL", "https://api.mainnet-beta.solana.com")
@@ -18,24 +26,29 @@ HTTP_FALLBACK_URLS = [u.strip() for u in os.getenv(
     "HTTP_FALLBACK_URLS", "https://mainnet.helius-rpc.com/?api-key=<YOUR_KEY>"
 ).split(",") if u.strip() and "<YOUR_KEY>" not in u]
 HTTP_FALLBACK_COOLDOWN_SEC = int(os.getenv("HTTP_FALLBACK_COOLDOWN_SEC", "20"))
+HTTP_BREAKER_TRIPS = int(os.getenv("HTTP_BREAKER_TRIPS", "2"))  # 同一 provider 連續失敗幾次才進冷卻（斷路）
 
 # 各項節流/退讓
 HTTP_MIN_INTERVAL_MS = int(os.getenv("HTTP_MIN_INTERVAL_MS", "1200"))
 HTTP_429_BACKOFF_MS  = int(os.getenv("HTTP_429_BACKOFF_MS", "1800"))
+HTTP_CONCURRENCY     = int(os.getenv("HTTP_CONCURRENCY", "4"))  # 同時在途的 RPC 請求上限（遇限流時自動減半）
 
 # 監控 Program
-PROGRAM_IDS = [p.strip() for p in os.getenv("PROGRAM_IDS", "").split(",") if p.strip()]
+PROGRAM_IDS = [sys.intern(p.strip()) for p in os.getenv("PROGRAM_IDS", "").split(",") if p.strip()]
+FOCUS = frozenset(PROGRAM_IDS)  # 啟動時建一次，分類時直接查，不必每次傳入/重建 set
 
 # Telegram
 TG_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 TG_CHAT  = os.getenv("TELEGRAM_CHAT_ID", "")
 
 # =========================== 行為調參 ===========================
-TX_FETCH_RETRIES   = int(os.getenv("TX_FETCH_RETRIES", "2"))
-TX_FETCH_DELAY_MS  = int(os.getenv("TX_FETCH_DELAY_MS", "700"))
+TX_STATUS_POLLS    = int(os.getenv("TX_STATUS_POLLS", "6"))
+TX_STATUS_DELAY_MS = int(os.getenv("TX_STATUS_DELAY_MS", "250"))
+TX_STATUS_DELAY_CAP_MS = int(os.getenv("TX_STATUS_DELAY_CAP_MS", "2000"))
 
 PROCESS_QPS = float(os.getenv("PROCESS_QPS", "0.6"))
 MAX_QUEUE   = int(os.getenv("MAX_QUEUE", "300"))
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", "2"))
 
 WATCH_NEW_POOL  = os.getenv("WATCH_NEW_POOL", "1") == "1"
 WATCH_ADDLP     = os.getenv("WATCH_ADDLP",  "0") == "1"
@@ -67,46 +80,343 @@ JUP_QUOTE_URL = os.getenv("JUP_QUOTE_URL", "https://quote-api.jup.ag/v6/quote")
 JUP_TEST_IN_LAMPORTS = int(os.getenv("JUP_TEST_IN_LAMPORTS", "50000000"))  # 0.05 SOL
 
 # =========================== 標籤 ===========================
-PROGRAM_LABELS = {
+class _LabelMap(dict):
+    # 未登錄的 program 直接以 id 當標籤並記下，之後同一 id 只需一次 dict 查詢
+    def __missing__(self, pid):
+        v = self[pid] = pid or "Unknown Program"
+        return v
+
+PROGRAM_LABELS = _LabelMap({
     "CPMMoo8L3F4NbTegBCKVNunggL7H1ZpdTHKxQB5qKP1C": "Raydium CPMM",
     "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8": "Raydium AMM v4 (Legacy)",
     "CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK": "Raydium CLMM",
     "whirLbMiicVdio4qvUfM5KAg6Ct8VwpYzGff3uctyCc": "Orca Whirlpool",
-}
+})
 
 # =========================== 狀態 ===========================
-SEEN_SIGS = deque(maxlen=20000)
-SEEN_SET  = set()
+SEEN_CAP = int(os.getenv("SEEN_CAP", "20000"))
+SEEN = OrderedDict()  # 近期 sig 的有界 LRU：O(1) 查詢與淘汰
 REQUEUED_ONCE = set()
+STATS = {"enqueued": 0, "dropped": 0, "fast_dropped": 0}  # 計數器，/stats 可查
+
+# 跨重啟去重：mmap 的 Bloom filter（16 bytes header + 2^22 bits = 512 KiB）
+# 只供單一行程使用（見下方 Start：本服務固定單行程）：查詢與寫入沒有跨行程鎖，
+# 多個行程同時映射同一檔會互相覆寫位元與計數，不可共用；檔案的用途只是讓本行程重啟後接續
+# 狀態檔預設放在程式所在目錄（不隨啟動時的 CWD 漂移）；啟動時才開檔，單純 import 不寫磁碟
+STATE_DIR = os.getenv("STATE_DIR", os.path.dirname(os.path.abspath(__file__)))
+SEEN_BLOOM_PATH = os.getenv("SEEN_BLOOM_PATH", os.path.join(STATE_DIR, "seen.bloom"))  # 留空 = 只放本行程記憶體、不持久化
+SEEN_BLOOM_BITS = 1 << 22
+SEEN_BLOOM_HASHES = 10  # 2^22 bits 下 k=10 最省：約 29 萬筆時誤判率 0.1%
+SEEN_BLOOM_CAPACITY = int(os.getenv("SEEN_BLOOM_CAPACITY", "250000"))  # 寫滿即清空，避免誤判率爬升
+_BLOOM_HDR = 16  # 8 bytes 參數標記 + 8 bytes 已寫入筆數
+_BLOOM_MAGIC = b"SBLM" + bytes([1, SEEN_BLOOM_HASHES, SEEN_BLOOM_BITS.bit_length() - 1, 0])
+
+def _bloom_open():
+    size = _BLOOM_HDR + SEEN_BLOOM_BITS // 8
+    bm = None
+    if SEEN_BLOOM_PATH:
+        try:
+            fd = os.open(SEEN_BLOOM_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != size:  # 新檔或大小變了：重建
+                    os.ftruncate(fd, 0); os.ftruncate(fd, size)
+                bm = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            # 持久化只是最佳化：目錄不存在/唯讀時退回純記憶體，服務照常啟動
+            print(f"[SEEN] 無法開啟 {SEEN_BLOOM_PATH}（{e}），bloom 改為只存記憶體")
+    if bm is None:
+        bm = mmap.mmap(-1, size)
+    if bm[:8] != _BLOOM_MAGIC:  # 雜湊參數不同的舊檔：位元佈局不相容，清空
+        bm[:] = bytes(size); bm[:8] = _BLOOM_MAGIC
+    return bm
+
+_SEEN_BLOOM = None  # seen_store_open() 時才建立
+
+def bloom_check_add(sig: str) -> bool:
+    """加入 Bloom filter；回傳加入前是否（可能）已存在。"""
+    bm, hdr = _SEEN_BLOOM, _BLOOM_HDR
+    if bm is None: return False
+    d = hashlib.blake2b(sig.encode(), digest_size=4 * SEEN_BLOOM_HASHES).digest()
+    bits = [int.from_bytes(d[i:i+4], "little") % SEEN_BLOOM_BITS for i in range(0, len(d), 4)]
+    if all(bm[hdr + (b >> 3)] & (1 << (b & 7)) for b in bits):
+        return True
+    count = int.from_bytes(bm[8:hdr], "little")
+    if count >= SEEN_BLOOM_CAPACITY:
+        bm[hdr:] = bytes(len(bm) - hdr); count = 0
+        print("[SEEN] bloom 已滿，清空重建")
+    for b in bits:
+        bm[hdr + (b >> 3)] |= 1 << (b & 7)
+    bm[8:hdr] = (count + 1).to_bytes(8, "little")
+    return False
+
+# 近期 sig 的精確紀錄：mmap 環形檔（固定 88 bytes 一格，依寫入順序覆寫最舊一格），重啟時整份灌回 SEEN
+# bloom 會誤判、寫滿也會清空；這份只保留最近 SEEN_CAP 筆，但重啟後立刻可做精確去重
+# 與 bloom 相同只供單一行程使用：head 由本行程持有，header 只是給下次啟動讀的副本
+# 不主動 fsync：MAP_SHARED 的頁面由核心寫回，行程崩潰不會遺失；只有整台機器斷電才可能少掉最後幾筆
+SEEN_RING_PATH = os.getenv("SEEN_RING_PATH", os.path.join(STATE_DIR, "seen.ring"))  # 留空 = 不持久化
+_RING_W = 88  # base58 簽章最長 88 字元，不足補 \0
+_RING_HDR = 16  # 8 bytes 格式標記 + 8 bytes 累計寫入數（head）
+_RING_MAGIC = b"SRNG" + _RING_W.to_bytes(2, "little") + bytes([1, 0])
+_SEEN_RING = None
+_ring_head = 0
+
+def _ring_entries(rm, cap: int):
+    # 由舊到新列出環內的 sig
+    head = int.from_bytes(rm[8:_RING_HDR], "little")
+    for i in range(max(0, head - cap), head):
+        off = _RING_HDR + (i % cap) * _RING_W
+        sig = rm[off:off + _RING_W].rstrip(b"\0")
+        if sig: yield sig
+
+def _ring_open():
+    cap = max(1, SEEN_CAP)
+    size = _RING_HDR + cap * _RING_W
+    keep = []
+    fd = os.open(SEEN_RING_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        cur = os.fstat(fd).st_size
+        if cur != size:
+            # SEEN_CAP 變了：先讀出舊環內容，重建後保留最新的 cap 筆，而不是整份清掉
+            old_cap = (cur - _RING_HDR) // _RING_W
+            if old_cap > 0 and cur == _RING_HDR + old_cap * _RING_W:
+                with mmap.mmap(fd, cur) as om:
+                    if om[:8] == _RING_MAGIC: keep = list(_ring_entries(om, old_cap))[-cap:]
+            os.ftruncate(fd, 0); os.ftruncate(fd, size)
+        rm = mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+    if rm[:8] != _RING_MAGIC:
+        rm[:] = bytes(size); rm[:8] = _RING_MAGIC
+    for i, sig in enumerate(keep):
+        off = _RING_HDR + i * _RING_W
+        rm[off:off + _RING_W] = sig.ljust(_RING_W, b"\0")
+    if keep: rm[8:_RING_HDR] = len(keep).to_bytes(8, "little")
+    return rm
+
+def _ring_append(sig: str):
+    global _ring_head
+    rm = _SEEN_RING
+    if rm is None: return
+    off = _RING_HDR + (_ring_head % max(1, SEEN_CAP)) * _RING_W
+    rm[off:off + _RING_W] = sig.encode()[:_RING_W].ljust(_RING_W, b"\0")
+    _ring_head += 1
+    rm[8:_RING_HDR] = _ring_head.to_bytes(8, "little")
+
+def seen_store_open():
+    # 由 start_background_tasks 呼叫：開 bloom/環形檔，並由舊到新把環內 sig 灌回 SEEN
+    global _SEEN_BLOOM, _SEEN_RING, _ring_head
+    if _SEEN_BLOOM is None: _SEEN_BLOOM = _bloom_open()
+    if _SEEN_RING is None and SEEN_RING_PATH:
+        try:
+            _SEEN_RING = _ring_open()
+        except OSError as e:
+            # 無法持久化就只靠記憶體內的 SEEN，不擋啟動
+            print(f"[SEEN] 無法開啟 {SEEN_RING_PATH}（{e}），近期 sig 不持久化")
+            return
+        _ring_head = int.from_bytes(_SEEN_RING[8:_RING_HDR], "little")
+        for sig in _ring_entries(_SEEN_RING, max(1, SEEN_CAP)): SEEN[sig.decode()] = None
+        while len(SEEN) > SEEN_CAP: SEEN.popitem(last=False)
+
+def seen_store_close():
+    global _SEEN_BLOOM, _SEEN_RING
+    for mm in (_SEEN_BLOOM, _SEEN_RING):
+        if mm is not None: mm.flush(); mm.close()
+    _SEEN_BLOOM = _SEEN_RING = None
+
+# 有界 LRU（OrderedDict：命中移到尾端、超量從頭淘汰）
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "4096"))
+MINT_INFO_TTL_SEC   = float(os.getenv("MINT_INFO_TTL_SEC", "60"))  # authority 皆已撤銷（不可逆）時的 TTL
+MINT_INFO_PENDING_TTL_SEC = float(os.getenv("MINT_INFO_PENDING_TTL_SEC", "2"))  # 尚有 authority：新池常在幾秒內撤銷，快取要短
+TOP_HOLDERS_TTL_SEC = float(os.getenv("TOP_HOLDERS_TTL_SEC", "15"))  # 持幣分布變動較快，TTL 短一些
+_CLASSIFY_CACHE  = OrderedDict()  # sig  -> AnalysisResult
+_MINT_INFO_CACHE = OrderedDict()  # mint -> (expires_at, info)
+_TOP_HOLDERS_CACHE = OrderedDict()  # mint -> (expires_at, pct)
+
+def _lru_get(cache: OrderedDict, key):
+    v = cache.get(key)
+    if v is not None: cache.move_to_end(key)
+    return v
+
+def _lru_put(cache: OrderedDict, key, value, cap: int):
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > cap: cache.popitem(last=False)
+
+def seen_check_add(sig: str) -> bool:
+    # 近期用精確 LRU；更久以前（含重啟前）的靠 bloom 擋
+    if sig in SEEN:
+        SEEN.move_to_end(sig); return True
+    SEEN[sig] = None
+    if len(SEEN) > SEEN_CAP: SEEN.popitem(last=False)
+    _ring_append(sig)
+    return bloom_check_add(sig)
 
 # =========================== Provider 管理（每 provider 各自冷卻） ===========================
 PROVIDERS = [RPC_HTTP_URL] + [u for u in HTTP_FALLBACK_URLS if u and u != RPC_HTTP_URL]
 _prov_cooldown = {u: 0.0 for u in PROVIDERS}  # 各 provider 的冷卻截止時間
+_prov_fail_streak = {u: 0 for u in PROVIDERS}  # 各 provider 連續失敗次數（成功即歸零）
 _http_last_call = 0.0
 _http_global_backoff_until = 0.0
 
+# =========================== 可調整的在途請求上限（Condition 控制，C_max 可動態縮放） ===========================
+_http_inflight = 0
+_http_cmax = max(1, HTTP_CONCURRENCY)
+_http_cmax_restore_at = 0.0
+_http_cond = asyncio.Condition()
+
+def _http_cmax_shrink():
+    # provider 被限流/故障：上限減半，冷卻期滿後恢復
+    global _http_cmax, _http_cmax_restore_at
+    _http_cmax = max(1, _http_cmax // 2)
+    _http_cmax_restore_at = time.time() + HTTP_FALLBACK_COOLDOWN_SEC
+
+def _http_cmax_maybe_restore() -> bool:
+    global _http_cmax
+    if _http_cmax < HTTP_CONCURRENCY and time.time() >= _http_cmax_restore_at:
+        _http_cmax = max(1, HTTP_CONCURRENCY)
+        return True
+    return False
+
+async def _http_acquire():
+    global _http_inflight
+    async with _http_cond:
+        if _http_cmax_maybe_restore(): _http_cond.notify_all()
+        await _http_cond.wait_for(lambda: _http_inflight < _http_cmax)
+        _http_inflight += 1
+
+async def _http_release():
+    global _http_inflight
+    async with _http_cond:
+        _http_inflight -= 1
+        if _http_cmax_maybe_restore(): _http_cond.notify_all()
+        else: _http_cond.notify(1)
+
 # =========================== 小工具 ===========================
+# Telegram 送出走佇列 + 背景 worker：呼叫端不 await 網路，TG 卡住也不會拖住 event loop
+TG_QUEUE = asyncio.Queue(maxsize=int(os.getenv("TG_QUEUE_MAX", "200")))
+
 def tg_send(text: str):
     if not TG_TOKEN or not TG_CHAT:
         print("[TG] 未設定，略過：", text[:160]); return
     try:
-        url = f"https://api.telegram.org/bot{TG_TOKEN}/sendMessage"
-        r = requests.post(url, data={"chat_id": TG_CHAT, "text": text, "parse_mode": "HTML"}, timeout=8)
+        TG_QUEUE.put_nowait(text)
+    except asyncio.QueueFull:
+        print("[TG] 佇列已滿，丟棄：", text[:160])
+
+async def _tg_post(text: str):
+    try:
+        url = f"{_TG_HOST}/bot{TG_TOKEN}/sendMessage"
+        r = await _HTTP.post(url, data={"chat_id": TG_CHAT, "text": text, "parse_mode": "HTML"}, timeout=8)
+        _last_used[_TG_HOST] = time.time()
         if r.status_code != 200:
             print("[TG] 送出失敗:", r.status_code, r.text)
     except Exception as e:
         print("[TG] 例外:", e)
 
-def program_label(pid): return PROGRAM_LABELS.get(pid or "", pid or "Unknown Program")
-def format_sig_link(sig: str) -> str: return f"https://solscan.io/tx/{sig}"
-def _mint_symbol(m: str) -> str:
-    if m == "So11111111111111111111111111111111111111112": return "SOL"
-    if m == "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1": return "USDC"
-    return m[:4] + "…" + m[-4:]
+TG_BATCH_MAX = int(os.getenv("TG_BATCH_MAX", "5"))
+TG_MIN_INTERVAL_MS = int(os.getenv("TG_MIN_INTERVAL_MS", "1000"))  # Telegram 同一 chat 約 1 則/秒
+_TG_SEP = "\n\n—\n\n"
+_TG_MAX_LEN = 4096
+
+async def tg_worker():
+    # 有積壓時把已在佇列中的多則合併成一則送出（上限 TG_BATCH_MAX 則、4096 字）；
+    # 佇列空時照常單則立即送，不額外等待
+    carry, last = None, 0.0
+    while True:
+        buf = [carry if carry is not None else await TG_QUEUE.get()]
+        carry = None
+        size = len(buf[0])
+        while len(buf) < max(1, TG_BATCH_MAX) and not TG_QUEUE.empty():
+            nxt = TG_QUEUE.get_nowait()
+            if size + len(_TG_SEP) + len(nxt) > _TG_MAX_LEN:
+                carry = nxt; break
+            buf.append(nxt); size += len(_TG_SEP) + len(nxt)
+        wait = last + TG_MIN_INTERVAL_MS / 1000.0 - time.time()
+        if wait > 0: await asyncio.sleep(wait)
+        try:
+            await _tg_post(_TG_SEP.join(buf))
+        finally:
+            last = time.time()
+            for _ in buf: TG_QUEUE.task_done()
+
+_B58_IDX = {c: i for i, c in enumerate("123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz")}
+def _is_pubkey(s: str) -> bool:
+    # base58 解碼後須恰為 32 bytes（開頭每個 '1' 代表一個 0x00）
+    if not s or not 32 <= len(s) <= 44 or any(c not in _B58_IDX for c in s): return False
+    n = 0
+    for c in s: n = n * 58 + _B58_IDX[c]
+    return len(s) - len(s.lstrip("1")) + (n.bit_length() + 7) // 8 == 32
+
+def program_label(pid): return PROGRAM_LABELS[pid]
+_SOLSCAN_TX = "https://solscan.io/tx/"
+_SYMBOLS = {
+    "So11111111111111111111111111111111111111112": "SOL",
+    "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1": "USDC",
+}
+def _mint_symbol(m: str) -> str: return _SYMBOLS.get(m) or (m[:4] + "…" + m[-4:])
+
+# =========================== 共用 HTTP 連線池（keep-alive + HTTP/2，RPC 與 Jupiter 共用） ===========================
+# 連線保溫：啟動時先把 DNS/TCP/TLS 握手做掉，之後定期送便宜請求，避免閒置後第一筆事件多付一次 RTT
+HTTP_KEEPALIVE_SEC = float(os.getenv("HTTP_KEEPALIVE_SEC", "30"))  # <= 0 關閉
+
+_HTTP = httpx.AsyncClient(
+    http2=True, timeout=8.0,
+    # 閒置連線的保留時間必須長於保溫間隔（httpx 預設只有 5s），否則每次保溫都是重新握手
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50,
+                        keepalive_expiry=max(5.0, HTTP_KEEPALIVE_SEC * 2)),
+)
+_last_used = {}  # 端點 -> 最近一次實際送出請求的時間；近期用過的連線本來就是熱的，不必再保溫
+_TG_HOST = "https://api.telegram.org"
+
+async def http_shutdown():
+    await _HTTP.aclose()
+
+_KEEPALIVE_BODY = orjson.dumps({"jsonrpc": "2.0", "id": 0, "method": "getSlot"})
+
+async def _keepalive_ping(key: str, send):
+    try: await send()
+    except Exception: pass  # 保溫失敗不計入斷路：真正的查詢自會判斷
+    _last_used[key] = time.time()
+
+async def http_keepalive():
+    # 只保溫閒置中的端點；斷路冷卻中的 provider 與全域 429 退讓期間一律不打
+    while True:
+        now = time.time()
+        idle = lambda k: now - _last_used.get(k, 0.0) >= HTTP_KEEPALIVE_SEC
+        pings = []
+        if now >= _http_global_backoff_until:
+            pings += [
+                _keepalive_ping(u, functools.partial(
+                    _HTTP.post, u, content=_KEEPALIVE_BODY, headers={"Content-Type": "application/json"}))
+                for u in PROVIDERS if now >= _prov_cooldown.get(u, 0.0) and idle(u)
+            ]
+        if TG_TOKEN and idle(_TG_HOST):
+            pings.append(_keepalive_ping(_TG_HOST, functools.partial(_HTTP.get, f"{_TG_HOST}/bot{TG_TOKEN}/getMe")))
+        if pings: await asyncio.gather(*pings)
+        await asyncio.sleep(HTTP_KEEPALIVE_SEC)
 
 # =========================== HTTP 請求（節流 + 429 全域退讓 + 每 provider 冷卻 + 強韌解析） ===========================
-async def _http_post(payload: dict) -> dict:
-    global _http_last_call, _http_global_backoff_until, _prov_cooldown
+def _is_provider_error(err: dict) -> bool:
+    code = err.get("code")
+    msg  = (err.get("message") or "").lower()
+    is_rate = (code in (-32429, 429)) or ("too many" in msg) or ("max usage" in msg)
+    is_bad  = ("non-json" in msg) or ("request failure" in msg) or ("http error" in msg)
+    return is_rate or is_bad
+
+def _provider_failed(url: str):
+    # 斷路器：連續失敗達 HTTP_BREAKER_TRIPS 才把該 provider 打入冷卻，改走其他 provider
+    _prov_fail_streak[url] = _prov_fail_streak.get(url, 0) + 1
+    if _prov_fail_streak[url] >= max(1, HTTP_BREAKER_TRIPS):
+        _prov_fail_streak[url] = 0
+        _prov_cooldown[url] = time.time() + HTTP_FALLBACK_COOLDOWN_SEC
+        _http_cmax_shrink()
+        print(f"[HTTP] provider 冷卻：{url}  {HTTP_FALLBACK_COOLDOWN_SEC}s")
+
+async def _http_post(payload):
+    """payload 可為單筆 dict 或 JSON-RPC 批次 list；批次成功時回傳 list，其餘情況一律回 dict。"""
+    global _http_last_call, _http_global_backoff_until
 
     now = time.time()
     if now < _http_global_backoff_until:
@@ -130,233 +440,405 @@ async def _http_post(payload: dict) -> dict:
     else:
         use_url = ready[0]
 
+    await _http_acquire()
     try:
-        async with httpx.AsyncClient(timeout=8, headers={"Content-Type": "application/json"}) as client:
-            r = await client.post(use_url, json=payload)
-            _http_last_call = time.time()
+        r = await _HTTP.post(use_url, content=orjson.dumps(payload), headers={"Content-Type": "application/json"})
+        _http_last_call = _last_used[use_url] = time.time()
 
-            # 強韌解析：確保回 dict
-            try:
-                j = r.json()
-            except Exception:
-                txt = (r.text or "").strip()
-                j = {"error": {"code": r.status_code, "message": f"non-json response: {txt[:160]}"}}
+        # 強韌解析：確保回 dict
+        try:
+            j = orjson.loads(r.content)
+        except Exception:
+            txt = r.content[:160].decode("utf-8", "replace").strip()  # 只解碼訊息需要的前段
+            j = {"error": {"code": r.status_code, "message": f"non-json response: {txt}"}}
+        if isinstance(payload, list) and isinstance(j, list) and r.status_code < 400:
+            errs = [x.get("error") for x in j if isinstance(x, dict) and isinstance(x.get("error"), dict)]
+        else:
             if not isinstance(j, dict):
                 j = {"error": {"code": r.status_code, "message": str(j)}}
             if r.status_code >= 400 and "error" not in j:
                 j = {"error": {"code": r.status_code, "message": "http error"}}
+            errs = [j["error"]] if j.get("error") else []
 
-            # 針對「該 provider」冷卻；同時觸發全域退讓
-            err = j.get("error")
-            if err:
-                code = err.get("code")
-                msg  = (err.get("message") or "").lower()
-                is_rate = (code in (-32429, 429)) or ("too many" in msg) or ("max usage" in msg)
-                is_bad  = ("non-json" in msg) or ("request failure" in msg) or ("http error" in msg)
-                if is_rate or is_bad:
-                    _prov_cooldown[use_url] = time.time() + HTTP_FALLBACK_COOLDOWN_SEC
-                    print(f"[HTTP] provider 冷卻：{use_url}  {HTTP_FALLBACK_COOLDOWN_SEC}s")
-                    if HTTP_429_BACKOFF_MS > 0:
-                        _http_global_backoff_until = time.time() + (HTTP_429_BACKOFF_MS/1000.0)
-                        print(f"[HTTP] 全域暫停 {HTTP_429_BACKOFF_MS}ms")
-            return j
+        # 針對「該 provider」記一次失敗；同時觸發全域退讓（批次中任一筆被限流即算）
+        if any(_is_provider_error(err) for err in errs):
+            _provider_failed(use_url)
+            if HTTP_429_BACKOFF_MS > 0:
+                _http_global_backoff_until = time.time() + (HTTP_429_BACKOFF_MS/1000.0)
+                print(f"[HTTP] 全域暫停 {HTTP_429_BACKOFF_MS}ms")
+        else:
+            _prov_fail_streak[use_url] = 0
+        return j
     except Exception as e:
-        _prov_cooldown[use_url] = time.time() + HTTP_FALLBACK_COOLDOWN_SEC
+        _provider_failed(use_url)
         return {"error": {"message": f"request failure: {e}"}}
+    finally:
+        await _http_release()
+
+# =========================== JSON-RPC 批次（時間窗內的請求合併成單一 POST） ===========================
+RPC_BATCH_WINDOW_MS = int(os.getenv("RPC_BATCH_WINDOW_MS", "20"))
+RPC_BATCH_MAX       = int(os.getenv("RPC_BATCH_MAX", "20"))
+_RPC_BATCH_Q = asyncio.Queue()
+_rpc_batcher_task = None
+
+async def _rpc_batched(method: str, params: list) -> dict:
+    global _rpc_batcher_task
+    if _rpc_batcher_task is None or _rpc_batcher_task.done():
+        _rpc_batcher_task = asyncio.create_task(_rpc_batcher())
+    fut = asyncio.get_running_loop().create_future()
+    _RPC_BATCH_Q.put_nowait((method, params, fut))
+    return await fut
+
+async def _rpc_batcher():
+    window = RPC_BATCH_WINDOW_MS / 1000.0
+    while True:
+        batch = [await _RPC_BATCH_Q.get()]
+        deadline = time.time() + window
+        while len(batch) < max(1, RPC_BATCH_MAX):
+            left = deadline - time.time()
+            if left <= 0: break
+            try: batch.append(await asyncio.wait_for(_RPC_BATCH_Q.get(), left))
+            except asyncio.TimeoutError: break
+        # 送出期間（含節流等待）進來的請求會累積成下一批
+        try:
+            await _rpc_send_batch(batch)
+        except Exception as e:
+            # 這批已離開佇列，重啟批次器也救不回：直接回錯給還在等的呼叫端，迴圈照常繼續
+            print("[RPC] batch 送出例外:", e)
+            for _, _, fut in batch:
+                if not fut.done(): fut.set_result({"error": {"message": f"batch failure: {e}"}})
+
+async def _rpc_send_batch(batch: list):
+    # getSignatureStatuses 本身就收 sig 陣列：同批的合併成單一呼叫，回來再依位置切回各自的 future
+    calls = [(m, p, fut) for m, p, fut in batch if m != "getSignatureStatuses"]
+    st = [(p, fut) for m, p, fut in batch if m == "getSignatureStatuses"]
+    if st:
+        sigs = [sig for p, _ in st for sig in p[0]]
+        calls.append(("getSignatureStatuses", [sigs, st[0][0][1]], None))
+    try:
+        payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p, _) in enumerate(calls)]
+        res = await _http_post(payload if len(payload) > 1 else payload[0])
+        if isinstance(res, list):
+            by_id = {x.get("id"): x for x in res if isinstance(x, dict)}
+            outs = [by_id.get(i) or {"error": {"message": "missing batch response"}} for i in range(len(calls))]
+        else:  # 單筆，或整批失敗（429 / non-json / 連線錯誤）
+            outs = [res] * len(calls)
+    except Exception as e:
+        outs = [{"error": {"message": f"batch failure: {e}"}}] * len(calls)
+    try:
+        for (_, _, fut), out in zip(calls, outs):
+            if fut is not None:
+                if not fut.done(): fut.set_result(out)
+                continue
+            result = out.get("result") if "error" not in out else None
+            vals = (result or {}).get("value") if isinstance(result, dict) else None
+            if result is not None and not isinstance(vals, list):
+                out = {"error": {"message": "malformed getSignatureStatuses value"}}
+                vals = None
+            i = 0
+            for p, f in st:
+                n = len(p[0])
+                part = out if vals is None else {"result": {"context": result.get("context"), "value": vals[i:i+n]}}
+                i += n
+                if not f.done(): f.set_result(part)
+    finally:
+        # 任何意外都不能讓呼叫端永遠卡在 await（每個卡住的呼叫端都佔掉一個 worker）
+        for _, _, f in batch:
+            if not f.done(): f.set_result({"error": {"message": "batch dispatch failure"}})
 
 # =========================== RPC 包裝 ===========================
 async def rpc_http_get_transaction_once(sig: str):
-    j = await _http_post({
-        "jsonrpc": "2.0", "id": 1, "method": "getTransaction",
-        "params": [sig, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}]
-    })
+    j = await _rpc_batched("getTransaction", [sig, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}])
     if "error" in j:
         print(f"[RPC] getTransaction error for {sig}: {j['error']}")
         return None
     return j.get("result")
 
 async def rpc_http_get_signature_status(sig: str):
-    j = await _http_post({
-        "jsonrpc": "2.0", "id": 1, "method": "getSignatureStatuses",
-        "params": [[sig], {"searchTransactionHistory": True}]
-    })
+    j = await _rpc_batched("getSignatureStatuses", [[sig], {"searchTransactionHistory": True}])
     if "error" in j:
         print(f"[RPC] getSignatureStatuses error for {sig}: {j['error']}")
-        return None
-    arr = (j.get("result", {}).get("value") or [])
+        return "error"
+    arr = ((j.get("result") or {}).get("value") or [])
     if arr and arr[0]:
         return (arr[0].get("confirmationStatus") or "").lower()
     return None
 
+def _backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # 指數回退 + 上限 + ±20% 抖動，避免多個 sig 同步重試擠爆同一端點
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.8, 1.2)
+
 async def rpc_http_get_transaction(sig: str):
-    # 1) 先等到 confirmed/finalized（最多 6 次，指數回退）
-    delay = 0.5
-    for _ in range(6):
-        st = await rpc_http_get_signature_status(sig)
-        if st in ("confirmed", "finalized"):
+    # 先用便宜的 getSignatureStatuses 輪詢，確認 confirmed/finalized 後才拉交易；
+    # 尚未落地時不打 getTransaction（必定落空）
+    if TX_STATUS_POLLS <= 0:
+        # 關閉狀態輪詢：直接拉一次交易
+        return await rpc_http_get_transaction_once(sig)
+    base, cap = TX_STATUS_DELAY_MS / 1000.0, TX_STATUS_DELAY_CAP_MS / 1000.0
+    attempt = 0
+    confirmed = False
+    for i in range(TX_STATUS_POLLS):
+        st = None
+        if not confirmed:
+            st = await rpc_http_get_signature_status(sig)
+            confirmed = st in ("confirmed", "finalized")
+        if confirmed:
+            # 已確認但節點還沒能回交易（索引落後）：之後只重拉交易，不再回頭查狀態
+            tx = await rpc_http_get_transaction_once(sig)
+            if tx:
+                return tx
+        if i == TX_STATUS_POLLS - 1:
             break
-        await asyncio.sleep(delay)
-        delay *= 1.4
-
-    # 2) 再拉交易（小次數，指數回退）
-    delay = TX_FETCH_DELAY_MS / 1000.0
-    for _ in range(max(1, TX_FETCH_RETRIES)):
-        tx = await rpc_http_get_transaction_once(sig)
-        if tx:
-            return tx
-        await asyncio.sleep(delay)
-        delay *= 1.5
+        if st == "error" and time.time() < _http_global_backoff_until:
+            # 被限流：全域退讓與 provider 切換由 _http_post 負責，這裡不再疊加等待
+            continue
+        # 交易尚未落地：短間隔輪詢，逐次拉長
+        await asyncio.sleep(_backoff_delay(attempt, base, cap))
+        attempt += 1
     return None
 
 # =========================== 事件判別 ===========================
 INIT_KEYS  = {"initialize", "initialize2", "initialize_pool", "init_pool", "create_pool", "open_position", "initialize_tick_array", "initialize_config"}
 ADDLP_KEYS = {"add_liquidity", "deposit_liquidity", "increase_liquidity"}
 
-def _match_type_like(s: str, keys: set) -> bool:
-    s = (s or "").lower()
-    return any(k in s for k in keys)
-
 def extract_program_instructions(tx: dict):
-    if not tx: return []
-    res = []
+    # generator：呼叫端命中即可 break，不必先組出完整 outer+inner list
+    if not tx: return
     msg = (tx.get("transaction") or {}).get("message") or {}
-    for ins in (msg.get("instructions") or []): res.append(ins)
+    yield from (msg.get("instructions") or [])
     meta = tx.get("meta") or {}
     for grp in (meta.get("innerInstructions") or []):
-        for ins in grp.get("instructions", []): res.append(ins)
-    return res
+        yield from (grp.get("instructions") or [])
+
+# 兩組關鍵字合成單一 alternation，一次掃描即可由命名群組得知類型
+_EVENT_RE = re.compile(
+    "(?P<NEW_POOL>%s)|(?P<ADD_LIQUIDITY>%s)" % (
+        "|".join(map(re.escape, sorted(INIT_KEYS))),
+        "|".join(map(re.escape, sorted(ADDLP_KEYS))),
+    ),
+    re.IGNORECASE,
+)
+_INIT_RE = re.compile("|".join(map(re.escape, sorted(INIT_KEYS))), re.IGNORECASE)
 
-def classify_event_by_tx(tx: dict, focus: set):
-    if not tx: return None, {}
+def _classify_ins(t: str):
+    m = _EVENT_RE.search(t)
+    if m is None: return None
+    kind = m.lastgroup
+    # NEW_POOL 優先：先撞到 add 類關鍵字時，只需往後再找 init 類
+    if kind == "ADD_LIQUIDITY" and _INIT_RE.search(t, m.end()): return "NEW_POOL"
+    return kind
+
+# 單趟分析結果：事件類型、命中的 program、交易對（base 為白名單幣，quote 為第一個非白名單帳戶）
+AnalysisResult = namedtuple("AnalysisResult", "ev_type program_id base quote")
+_NO_EVENT = AnalysisResult(None, None, None, None)
+
+def analyze_tx(tx: dict) -> AnalysisResult:
+    if not tx: return _NO_EVENT
+    # accountKeys 只攤平一次：分類用的 set 與交易對推測共用
+    keys = ((tx.get("transaction") or {}).get("message") or {}).get("accountKeys") or []
+    mints = [k.get("pubkey") if isinstance(k, dict) else k for k in keys]
+    keyset = set(mints)
+    if keyset and FOCUS.isdisjoint(keyset): return _NO_EVENT  # 與 FOCUS 無交集就不可能命中
     hit_prog = None; hit_type = None
-    for ins in extract_program_instructions(tx):
-        pid = ins.get("programId")
-        if not pid or pid not in focus: continue
-        parsed = ins.get("parsed") or {}
-        t = (parsed.get("type") or parsed.get("instruction")) or ""
-        if _match_type_like(t, INIT_KEYS):  hit_prog, hit_type = pid, "NEW_POOL"; break
-        if _match_type_like(t, ADDLP_KEYS): hit_prog, hit_type = pid, "ADD_LIQUIDITY"
+    # 以 (programId, type) 串流單趟掃描，命中 NEW_POOL 即停
+    pairs = (
+        (pid, (p.get("type") or p.get("instruction")) or "")
+        for pid, p in ((ins.get("programId"), ins.get("parsed")) for ins in extract_program_instructions(tx))
+        if pid in FOCUS and isinstance(p, dict)
+    )
+    for pid, t in pairs:
+        kind = _classify_ins(t)
+        if kind == "NEW_POOL": hit_prog, hit_type = pid, kind; break
+        if kind: hit_prog, hit_type = pid, kind
     if not hit_type:
         meta = tx.get("meta") or {}
-        logs = " ".join((meta.get("logMessages") or [])).lower()
-        if any(pid in (tx.get("transaction") or {}).get("message", {}).get("accountKeys", []) for pid in focus):
-            if _match_type_like(logs, INIT_KEYS):  hit_type = "NEW_POOL"
-            elif _match_type_like(logs, ADDLP_KEYS): hit_type = "ADD_LIQUIDITY"
+        logs = meta.get("logMessages") or []
+        mentioned = FOCUS & keyset
+        if mentioned:
+            for line in logs:
+                kind = _classify_ins(line)
+                if kind == "NEW_POOL": hit_type = kind; break
+                if kind: hit_type = kind
             if hit_type:
-                for k in focus:
-                    if k in logs: hit_prog = k; break
-    return hit_type, {"programId": hit_prog}
+                if len(mentioned) == 1:
+                    hit_prog = next(iter(mentioned))  # 只有一個關注 program 出現在交易中：不必掃 log
+                else:
+                    # program id 區分大小寫：直接比對原始 log，不可先 lower()
+                    hit_prog = next((k for k in mentioned if any(k in line for line in logs)), None)
+    if not hit_type: return _NO_EVENT
+    base = next((b for b in QUOTED_BASES if b in keyset), None)
+    quote = next((k for k in mints if k not in QUOTED_BASES), None)
+    return AnalysisResult(hit_type, hit_prog, base, quote)
+
+def analyze_sig(sig: str, tx: dict) -> AnalysisResult:
+    # 同一 sig 可能從 WS、webhook、重排多條路徑進來：分析結果按 sig 快取
+    hit = _lru_get(_CLASSIFY_CACHE, sig)
+    if hit is not None: return hit
+    res = analyze_tx(tx)
+    _lru_put(_CLASSIFY_CACHE, sig, res, CLASSIFY_CACHE_SIZE)
+    return res
+
+# 只含目前關注的關鍵字（WATCH_* 關掉的類型不列入）：logs 預篩與 WS 原始 frame 預篩共用
+_HINT_KEYS = (INIT_KEYS if WATCH_NEW_POOL else set()) | (ADDLP_KEYS if WATCH_ADDLP else set())
+_HINT_RE = re.compile("|".join(map(re.escape, sorted(_HINT_KEYS))), re.IGNORECASE) if _HINT_KEYS else None
 
 def logs_hint_is_candidate(logs: list) -> bool:
-    s = " ".join((logs or [])).lower()
-    if not s: return False
-    hit_init  = any(k in s for k in INIT_KEYS)
-    hit_addlp = any(k in s for k in ADDLP_KEYS)
-    if WATCH_NEW_POOL and hit_init: return True
-    if WATCH_ADDLP   and hit_addlp: return True
-    return False
+    # 逐行掃描、命中即返回；不 join 整份 logs 也不 lower()
+    if not logs or _HINT_RE is None: return False
+    return any(_HINT_RE.search(line) for line in logs)
+
+_SIG_RE = re.compile(r'"signature"\s*:\s*"([1-9A-HJ-NP-Za-km-z]+)"')
+
+def raw_frame_may_be_candidate(raw: str) -> bool:
+    if _HINT_RE is None: return False
+    return _HINT_RE.search(raw) is not None
+
+def raw_frame_sig(raw: str):
+    m = _SIG_RE.search(raw)
+    return m.group(1) if m else None
 
 # =========================== 交易對 / 濾網輔助 ===========================
-def guess_pair_from_tx(tx: dict):
-    if not tx: return (None, None)
-    keys = (tx.get("transaction") or {}).get("message", {}).get("accountKeys", []) or []
-    mints = [k.get("pubkey") if isinstance(k, dict) else k for k in keys]
-    base = None
-    for b in QUOTED_BASES:
-        if b in mints: base = b; break
-    if not base: return (None, None)
-    quote = None
-    for pk in mints:
-        if pk != base and pk not in QUOTED_BASES:
-            quote = pk; break
-    return (base, quote)
+# single-flight：同一 key 同時只跑一個查詢，其餘呼叫者共用結果。
+# 以 shield 等待，個別呼叫者被取消（例如濾網提早結束）不會連帶取消共用查詢
+_INFLIGHT = {}  # key -> asyncio.Task
 
-async def get_mint_info(mint_pubkey: str):
+def _single_flight(key, coro_fn):
+    t = _INFLIGHT.get(key)
+    if t is None:
+        t = asyncio.create_task(coro_fn())
+        _INFLIGHT[key] = t
+        t.add_done_callback(lambda _t: _INFLIGHT.pop(key, None))
+    return asyncio.shield(t)
+
+async def _fetch_mint_info(mint_pubkey: str):
     j = await _http_post({"jsonrpc": "2.0", "id": 1, "method": "getAccountInfo",
                           "params": [mint_pubkey, {"encoding": "jsonParsed"}]})
     if "error" in j: return None
     v = (j.get("result") or {}).get("value") or {}
-    return (v.get("data") or {}).get("parsed", {}).get("info")
+    info = (v.get("data") or {}).get("parsed", {}).get("info")
+    if info:
+        # 撤銷後不會再變回來，可以放心久存；還沒撤銷的只短暫快取，撤銷後很快就能通過濾網
+        revoked = info.get("mintAuthority") is None and info.get("freezeAuthority") is None
+        ttl = MINT_INFO_TTL_SEC if revoked else MINT_INFO_PENDING_TTL_SEC
+        _lru_put(_MINT_INFO_CACHE, mint_pubkey, (time.time() + ttl, info), CLASSIFY_CACHE_SIZE)
+    return info
 
-async def get_top_holders_pct(mint_pubkey: str):
+async def get_mint_info(mint_pubkey: str):
+    # 同一 mint 在 TTL 內不重打 getAccountInfo（TTL 依 authority 是否已撤銷而定，見 _fetch_mint_info）
+    hit = _lru_get(_MINT_INFO_CACHE, mint_pubkey)
+    if hit and hit[0] > time.time(): return hit[1]
+    return await _single_flight(("mint_info", mint_pubkey), lambda: _fetch_mint_info(mint_pubkey))
+
+async def _fetch_top10_amount(mint_pubkey: str):
     j = await _http_post({"jsonrpc": "2.0", "id": 1, "method": "getTokenLargestAccounts",
                           "params": [mint_pubkey, {"commitment": "confirmed"}]})
     if "error" in j: return None
     vals = (j.get("result") or {}).get("value") or []
-    top = sum([float(x.get("uiAmount", 0)) for x in vals[:10]])
-    info = await get_mint_info(mint_pubkey)
+    return sum([float(x.get("uiAmount") or 0) for x in vals[:10]])
+
+async def get_top_holders_pct(mint_pubkey: str, info_task=None):
+    # info_task：呼叫端已在跑的 get_mint_info task，共用結果避免重複 getAccountInfo
+    hit = _lru_get(_TOP_HOLDERS_CACHE, mint_pubkey)
+    if hit and hit[0] > time.time(): return hit[1]
+    top = await _single_flight(("top10", mint_pubkey), lambda: _fetch_top10_amount(mint_pubkey))
+    if top is None: return None
+    info = await (info_task or get_mint_info(mint_pubkey))
     if not info: return None
     supply = float(info.get("supply", 0)) / (10 ** int(info.get("decimals", 0)))
     if supply <= 0: return None
-    return (top / supply) * 100.0
+    pct = (top / supply) * 100.0
+    _lru_put(_TOP_HOLDERS_CACHE, mint_pubkey, (time.time() + TOP_HOLDERS_TTL_SEC, pct), CLASSIFY_CACHE_SIZE)
+    return pct
 
 async def jup_has_reasonable_route(mint_in: str, mint_out: str, in_amount: int):
     try:
-        async with httpx.AsyncClient(timeout=6) as client:
-            params = {"inputMint": mint_in, "outputMint": mint_out, "amount": in_amount, "slippageBps": 200}
-            r = await client.get(JUP_QUOTE_URL, params=params)
-            q = r.json()
-            routes = q.get("data") or []
-            if not routes: return (False, 99999)
-            rt = routes[0]
-            if not float(rt.get("inAmount", 0)) or not float(rt.get("outAmount", 0)):
-                return (False, 99999)
-            price_impact_bps = int(rt.get("priceImpactPct", 0) * 10000) if "priceImpactPct" in rt else 0
-            return (True, price_impact_bps)
+        params = {"inputMint": mint_in, "outputMint": mint_out, "amount": in_amount, "slippageBps": 200}
+        r = await _HTTP.get(JUP_QUOTE_URL, params=params, timeout=6)
+        q = orjson.loads(r.content)
+        routes = q.get("data") or []
+        if not routes: return (False, 99999)
+        rt = routes[0]
+        if not float(rt.get("inAmount", 0)) or not float(rt.get("outAmount", 0)):
+            return (False, 99999)
+        price_impact_bps = int(rt.get("priceImpactPct", 0) * 10000) if "priceImpactPct" in rt else 0
+        return (True, price_impact_bps)
     except Exception as e:
         print("[JUP] quote 失敗:", e)
         return (False, 99999)
 
-async def is_good_opportunity(tx: dict):
-    base, quote = guess_pair_from_tx(tx)
+async def is_good_opportunity(base: str, quote: str):
     if not base or not quote: return (False, "pair_not_supported")
-    if base not in QUOTED_BASES and quote not in QUOTED_BASES: return (False, "no_whitelisted_base")
-    if base not in QUOTED_BASES: base, quote = quote, base
-    if REQUIRE_AUTH_NONE:
-        mi = await get_mint_info(quote)
-        if not mi: return (False, "mint_info_unavailable")
-        if mi.get("mintAuthority") is not None or mi.get("freezeAuthority") is not None:
-            return (False, "mint_or_freeze_not_none")
-    ok, imp_bps = await jup_has_reasonable_route(base, quote, JUP_TEST_IN_LAMPORTS)
-    if not ok: return (False, "no_jup_route")
-    if imp_bps and imp_bps > MAX_PRICE_IMPACT_BPS: return (False, f"price_impact_too_high_{imp_bps}")
-    pct = await get_top_holders_pct(quote)
-    if pct is None or pct > MAX_TOP10_HOLDER_PCT: return (False, f"top10_holder_{pct or 'NA'}")
-    return (True, "ok")
+
+    # 三項檢查彼此獨立：並行發出，任一項不過就取消其餘
+    mi_t  = asyncio.create_task(get_mint_info(quote))
+    jup_t = asyncio.create_task(jup_has_reasonable_route(base, quote, JUP_TEST_IN_LAMPORTS))
+    top_t = asyncio.create_task(get_top_holders_pct(quote, mi_t))
+
+    def gate(t):
+        if t is mi_t:
+            if not REQUIRE_AUTH_NONE: return None
+            mi = t.result()
+            if not mi: return "mint_info_unavailable"
+            if mi.get("mintAuthority") is not None or mi.get("freezeAuthority") is not None:
+                return "mint_or_freeze_not_none"
+        elif t is jup_t:
+            ok, imp_bps = t.result()
+            if not ok: return "no_jup_route"
+            if imp_bps and imp_bps > MAX_PRICE_IMPACT_BPS: return f"price_impact_too_high_{imp_bps}"
+        else:
+            pct = t.result()
+            if pct is None or pct > MAX_TOP10_HOLDER_PCT: return f"top10_holder_{pct or 'NA'}"
+        return None
+
+    pending = {mi_t, jup_t, top_t}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                why = gate(t)
+                if why: return (False, why)
+        return (True, "ok")
+    finally:
+        for t in pending: t.cancel()
 
 # =========================== 一鍵連結 ===========================
+# 設定值在啟動時就代入，呼叫時只剩 format
+_JUP_BUY_TPL = (
+    f"{JUP_URL_BASE}/{{bsym}}-{{qsym}}?inputMint={{base}}&outputMint={{quote}}"
+    f"&amount={JUP_AMOUNT}&slippageBps={JUP_SLIPPAGE_BPS}"
+)
+_JUP_SELL_TPL = (
+    f"{JUP_URL_BASE}/{{qsym}}-{{bsym}}?inputMint={{quote}}&outputMint={{base}}"
+    f"{f'&amount={SELL_AMOUNT}' if SELL_AMOUNT else ''}&slippageBps={SELL_SLIPPAGE_BPS}"
+)
+_RAY_TPL = f"{RAY_URL_BASE}?inputCurrency={{src}}&outputCurrency={{dst}}&fixed=in"
+
+@functools.lru_cache(maxsize=4096)
 def build_trade_links(base_mint: str, quote_mint: str):
-    buy_jup = (
-        f"{JUP_URL_BASE}/{_mint_symbol(base_mint)}-{_mint_symbol(quote_mint)}"
-        f"?inputMint={base_mint}&outputMint={quote_mint}"
-        f"&amount={JUP_AMOUNT}&slippageBps={JUP_SLIPPAGE_BPS}"
-    )
-    buy_ray = f"{RAY_URL_BASE}?inputCurrency={base_mint}&outputCurrency={quote_mint}&fixed=in"
-    sell_jup = (
-        f"{JUP_URL_BASE}/{_mint_symbol(quote_mint)}-{_mint_symbol(base_mint)}"
-        f"?inputMint={quote_mint}&outputMint={base_mint}"
-        f"{f'&amount={SELL_AMOUNT}' if SELL_AMOUNT else ''}"
-        f"&slippageBps={SELL_SLIPPAGE_BPS}"
-    )
-    sell_ray = f"{RAY_URL_BASE}?inputCurrency={quote_mint}&outputCurrency={base_mint}&fixed=in"
+    bsym, qsym = _mint_symbol(base_mint), _mint_symbol(quote_mint)
+    buy_jup  = _JUP_BUY_TPL.format(bsym=bsym, qsym=qsym, base=base_mint, quote=quote_mint)
+    buy_ray  = _RAY_TPL.format(src=base_mint, dst=quote_mint)
+    sell_jup = _JUP_SELL_TPL.format(bsym=bsym, qsym=qsym, base=base_mint, quote=quote_mint)
+    sell_ray = _RAY_TPL.format(src=quote_mint, dst=base_mint)
     return buy_jup, buy_ray, sell_jup, sell_ray
 
 # =========================== 正式處理 ===========================
-async def _post_validate_and_notify(sig: str, focus: set, ws_ts: float = None):
+async def _post_validate_and_notify(sig: str, ws_ts: float = None, tx: dict = None):
     try:
-        tx = await rpc_http_get_transaction(sig)
+        # blockSubscribe 推來的交易已是完整內容，不必再打 getTransaction
+        if tx is None: tx = await rpc_http_get_transaction(sig)
         if not tx:
             if sig not in REQUEUED_ONCE:
                 REQUEUED_ONCE.add(sig)
                 print(f"[VALIDATE] 交易 {sig} 暫時取不到，2s 後重排一次")
                 await asyncio.sleep(2.0)
-                try: PROCESS_QUEUE.put_nowait((sig, ws_ts or time.time()))
-                except asyncio.QueueFull: pass
+                enqueue_sig(sig, ws_ts or time.time())  # 與新候選同一路徑：滿了照樣淘汰最舊並計入 /stats
                 return
             print(f"[VALIDATE] 交易 {sig} 二次仍失敗；略過")
             return
 
-        ev_type, details = classify_event_by_tx(tx, focus)
+        res = analyze_sig(sig, tx)
+        ev_type = res.ev_type
         if not ev_type:
             print(f"[CLASSIFY] skip {sig}: not NEW_POOL/ADD_LIQUIDITY")
             return
@@ -364,20 +846,13 @@ async def _post_validate_and_notify(sig: str, focus: set, ws_ts: float = None):
         if ev_type == "ADD_LIQUIDITY" and not WATCH_ADDLP: return
 
         if GOOD_ONLY:
-            ok, why = await is_good_opportunity(tx)
+            ok, why = await is_good_opportunity(res.base, res.quote)
             if not ok:
                 print(f"[FILTER] drop {sig} because {why}")
                 return
 
-        pid = (details or {}).get("programId")
-        label = program_label(pid)
-
-        base, quote = guess_pair_from_tx(tx)
-        if not base or base not in QUOTED_BASES: base = JUP_BASE
-        if not quote or quote in QUOTED_BASES:
-            keys = (tx.get("transaction") or {}).get("message", {}).get("accountKeys", []) or []
-            mints = [k.get("pubkey") if isinstance(k, dict) else k for k in keys]
-            quote = next((k for k in mints if k not in QUOTED_BASES), None)
+        label = program_label(res.program_id)
+        base, quote = (res.base or JUP_BASE), res.quote
 
         buy_jup=buy_ray=sell_jup=sell_ray=""
         if base and quote:
@@ -387,7 +862,7 @@ async def _post_validate_and_notify(sig: str, focus: set, ws_ts: float = None):
         lat = f"\n(延遲: {int((time.time() - ws_ts) * 1000)}ms)" if ws_ts else ""
         text = (
             f"{head}  <b>{label}</b>\n"
-            f"Sig: <code>{sig}</code>\n{format_sig_link(sig)}\n"
+            f"Sig: <code>{sig}</code>\n{_SOLSCAN_TX}{sig}\n"
             f"(已驗證{' + 過濾通過' if GOOD_ONLY else ''}){lat}"
         )
         if buy_jup:
@@ -399,60 +874,159 @@ async def _post_validate_and_notify(sig: str, focus: set, ws_ts: float = None):
     except Exception as e:
         print("[POST-VALIDATE] 解析失敗:", sig, e)
 
-# =========================== 佇列處理器（限速） ===========================
-PROCESS_QUEUE = asyncio.Queue(maxsize=MAX_QUEUE)
+# =========================== 佇列處理器（限速 + 固定 worker 數） ===========================
+class _Ring:
+    # 預先配置的固定容量環形緩衝（head/tail 索引）：滿了直接覆寫最舊的一筆，不另外出隊/入隊
+    __slots__ = ("buf", "cap", "head", "tail", "_waiters")
+
+    def __init__(self, cap: int):
+        self.cap = max(1, cap)
+        self.buf = [None] * self.cap
+        self.head = self.tail = 0
+        self._waiters = deque()
+
+    def __len__(self): return self.tail - self.head
+
+    def full(self) -> bool: return self.tail - self.head >= self.cap
 
-async def process_worker(focus: set):
+    def push(self, item) -> bool:
+        # 回傳是否覆寫掉一筆舊資料
+        dropped = self.full()
+        if dropped: self.head += 1
+        self.buf[self.tail % self.cap] = item
+        self.tail += 1
+        self._wake()
+        return dropped
+
+    def _wake(self):
+        while self._waiters:
+            w = self._waiters.popleft()
+            if not w.done(): w.set_result(None); return
+
+    async def pop(self):
+        while self.tail == self.head:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if self.tail != self.head: self._wake()  # 被叫醒後才取消：把名額讓給下一個 worker
+                raise
+        i = self.head % self.cap
+        item, self.buf[i] = self.buf[i], None
+        self.head += 1
+        return item
+
+PROCESS_QUEUE = _Ring(MAX_QUEUE)
+_process_next_at = 0.0  # 所有 worker 共用的下一個可處理時間點（總速率仍為 PROCESS_QPS）
+
+def enqueue_sig(sig: str, ws_ts: float, tx: dict = None):
+    # 佇列滿時覆寫最舊的一筆：寧可放棄過期的候選，也不讓任務無上限堆積
+    STATS["enqueued"] += 1
+    if PROCESS_QUEUE.push((sig, ws_ts, tx)): STATS["dropped"] += 1
+
+async def process_worker():
+    global _process_next_at
     interval = 1.0 / max(0.1, PROCESS_QPS)
-    last = 0.0
     while True:
-        sig, ws_ts = await PROCESS_QUEUE.get()
+        sig, ws_ts, tx = await PROCESS_QUEUE.pop()
         now = time.time()
-        wait = interval - (now - last)
-        if wait > 0: await asyncio.sleep(wait)
-        last = time.time()
-        try:
-            await _post_validate_and_notify(sig, focus, ws_ts)
-        finally:
-            PROCESS_QUEUE.task_done()
+        slot = max(now, _process_next_at)
+        _process_next_at = slot + interval
+        if slot > now: await asyncio.sleep(slot - now)
+        await _post_validate_and_notify(sig, ws_ts, tx)
 
 # =========================== WebSocket 訂閱 ===========================
+def _subscribe_msg(idx: int, pid: str, use_block: bool) -> str:
+    if use_block:
+        # blockSubscribe 不支援 processed，最低 confirmed
+        commitment = "confirmed" if WS_COMMITMENT == "processed" else WS_COMMITMENT
+        return orjson.dumps({
+            "jsonrpc": "2.0", "id": idx, "method": "blockSubscribe",
+            "params": [{"mentionsAccountOrProgram": pid}, {
+                "commitment": commitment, "encoding": "jsonParsed", "transactionDetails": "full",
+                "showRewards": False, "maxSupportedTransactionVersion": 0,
+            }]
+        }).decode()
+    return orjson.dumps({
+        "jsonrpc": "2.0", "id": idx, "method": "logsSubscribe",
+        "params": [{"mentions": [pid]}, {"commitment": WS_COMMITMENT}]
+    }).decode()
+
+def _handle_block_frame(msg: dict):
+    # 區塊內交易直接分類，只有命中的才進佇列（連同交易本體，worker 不必再查）
+    val = ((msg.get("params") or {}).get("result") or {}).get("value") or {}
+    block = val.get("block") or {}
+    ws_ts = time.time()
+    for tx in (block.get("transactions") or []):
+        sigs = (tx.get("transaction") or {}).get("signatures") or []
+        if not sigs: continue
+        sig = sigs[0]
+        if sig in SEEN: continue
+        if not logs_hint_is_candidate((tx.get("meta") or {}).get("logMessages")): continue
+        if not analyze_sig(sig, tx).ev_type: continue  # 結果進快取，worker 再分類時直接命中
+        if seen_check_add(sig): continue
+        enqueue_sig(sig, ws_ts, tx)
+
+def _block_unsupported(msg: dict) -> bool:
+    # 只認「訂閱請求本身」收到的 method not found；其他錯誤（暫時性失敗等）不放棄 block 模式
+    err = msg.get("error")
+    if not isinstance(err, dict) or msg.get("id") not in range(1, len(PROGRAM_IDS) + 1): return False
+    if err.get("code") != -32601 and "method not found" not in (err.get("message") or "").lower():
+        print("[WS] blockSubscribe 訂閱錯誤（保留 block 模式）：", err)
+        return False
+    return True
+
 async def ws_consume():
     if not PROGRAM_IDS:
         raise RuntimeError("PROGRAM_IDS 不可為空")
-    focus = set(PROGRAM_IDS)
     backoff, backoff_max = 5, 120
+    use_block = WS_BLOCK_SUBSCRIBE
     while True:
         try:
             print("[WS] connecting to:", RPC_WS_URL)
+            # 關掉 permessage-deflate（每個 frame 都要 inflate，事件量大時吃 CPU）；放寬單一 frame 上限與讀寫緩衝
             async with websockets.connect(
-                RPC_WS_URL, ping_interval=20, ping_timeout=20, close_timeout=5, max_queue=2000
+                RPC_WS_URL, ping_interval=20, ping_timeout=20, close_timeout=5, max_queue=2000,
+                compression=None, max_size=WS_MAX_SIZE if WS_MAX_SIZE > 0 else None,
+                read_limit=WS_BUFFER_LIMIT, write_limit=WS_BUFFER_LIMIT,
+                extra_headers={"User-Agent": "dex-pool-watcher/1.0"},
             ) as ws:
                 backoff = 5
                 for idx, pid in enumerate(PROGRAM_IDS, start=1):
-                    await ws.send(json.dumps({
-                        "jsonrpc": "2.0", "id": idx, "method": "logsSubscribe",
-                        "params": [{"mentions": [pid]}, {"commitment": WS_COMMITMENT}]
-                    }))
-                print("[WS] Subscribed to", PROGRAM_IDS)
-                while True:
-                    msg = json.loads(await ws.recv())
+                    await ws.send(_subscribe_msg(idx, pid, use_block))
+                print("[WS] Subscribed to", PROGRAM_IDS, "(blockSubscribe)" if use_block else "(logsSubscribe)")
+                async for raw in ws:
+                    if isinstance(raw, bytes): raw = raw.decode("utf-8", "ignore")
+                    if use_block:
+                        if '"blockNotification"' not in raw:
+                            if '"error"' in raw and _block_unsupported(orjson.loads(raw)):
+                                # 節點沒開 blockSubscribe：改回 logsSubscribe 重連（本行程不再嘗試）
+                                print("[WS] blockSubscribe 不支援，改用 logsSubscribe：", raw[:160])
+                                use_block = False
+                                break
+                            continue
+                        if not raw_frame_may_be_candidate(raw):
+                            STATS["fast_dropped"] += 1; continue
+                        _handle_block_frame(orjson.loads(raw))
+                        continue
+                    if '"logsNotification"' not in raw: continue  # 訂閱回覆等非通知 frame
+                    if not raw_frame_may_be_candidate(raw):
+                        STATS["fast_dropped"] += 1; continue
+                    if raw_frame_sig(raw) in SEEN: continue  # 重複通知（processed 常見）：不必解析
+                    msg = orjson.loads(raw)
                     if msg.get("method") != "logsNotification": continue
                     val = ((msg.get("params") or {}).get("result") or {}).get("value") or {}
-                    sig, logs = val.get("signature"), (val.get("logs") or [])
+                    sig = val.get("signature")
                     ws_ts = time.time()
-                    if not sig or sig in SEEN_SET: continue
-                    if not logs_hint_is_candidate(logs): continue
-                    SEEN_SET.add(sig); SEEN_SIGS.append(sig)
-                    try:
-                        PROCESS_QUEUE.put_nowait((sig, ws_ts))
-                    except asyncio.QueueFull:
-                        try:
-                            _ = PROCESS_QUEUE.get_nowait()
-                            PROCESS_QUEUE.task_done()
-                        except Exception:
-                            pass
-                        PROCESS_QUEUE.put_nowait((sig, ws_ts))
+                    # 關鍵字已在原始 frame 上篩過（logsNotification 只含 sig/err/logs），解析後不再重掃 logs
+                    if not sig or seen_check_add(sig): continue
+                    enqueue_sig(sig, ws_ts)
+                else:
+                    # 伺服器正常關閉（1000）：同樣走抖動退讓，避免被閒置/限流關線的節點立刻重連成風暴
+                    wait = max(1.0, backoff + random.uniform(-0.2*backoff, 0.2*backoff))
+                    print(f"[WS] 伺服器正常關閉連線，{wait:.1f}s 後重連")
+                    await asyncio.sleep(wait); backoff = min(backoff * 2, backoff_max)
         except websockets.exceptions.InvalidStatusCode as e:
             code = getattr(e, "status_code", None)
             wait = max(1.0, backoff + random.uniform(-0.2*backoff, 0.2*backoff))
@@ -463,47 +1037,68 @@ async def ws_consume():
             print(f"[WS] 連線中斷：{e}，{wait:.1f}s 後重連")
             await asyncio.sleep(wait); backoff = min(backoff * 2, backoff_max)
 
-# =========================== Flask（Webhook） ===========================
-app = Flask(__name__)
+# =========================== HTTP 服務（Webhook；與 WS/RPC 共用同一個 event loop） ===========================
+async def healthz(request: Request): return PlainTextResponse("ok")
 
-@app.get("/healthz")
-def healthz(): return "ok", 200
+async def stats(request: Request):
+    return JSONResponse({**STATS, "queue": len(PROCESS_QUEUE), "queue_max": MAX_QUEUE})
 
-@app.post("/helius")
-def helius_hook():
+async def helius_hook(request: Request):
     try:
-        data = request.get_json(force=True, silent=True) or {}
+        try: data = orjson.loads(await request.body())
+        except Exception: data = None
+        data = data or {}
         events = data if isinstance(data, list) else [data]
         handled = 0
         for ev in events:
             sig = ev.get("signature") or ev.get("transaction", "")
-            if not sig or sig in SEEN_SET: continue
-            SEEN_SET.add(sig); SEEN_SIGS.append(sig)
-            asyncio.run_coroutine_threadsafe(
-                _post_validate_and_notify(sig, set(PROGRAM_IDS), time.time()), loop
-            )
+            if not sig or seen_check_add(sig): continue
+            enqueue_sig(sig, time.time())
             handled += 1
-        return jsonify({"ok": True, "handled": handled}), 200
+        return JSONResponse({"ok": True, "handled": handled})
     except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+def start_background_tasks():
+    if not DISABLE_WS and not PROGRAM_IDS:
+        raise RuntimeError("PROGRAM_IDS 不可為空")
+    # 打錯字的 program id 訂閱不會報錯、只會永遠收不到事件：啟動時就擋下
+    bad = [p for p in [*PROGRAM_IDS, *PROGRAM_LABELS] if not _is_pubkey(p)]
+    if bad:
+        raise RuntimeError(f"不是合法的 base58 pubkey：{bad}")
+    seen_store_open()
+    tasks = [asyncio.create_task(process_worker()) for _ in range(max(1, PROCESS_WORKERS))]
+    tasks.append(asyncio.create_task(tg_worker()))
+    if HTTP_KEEPALIVE_SEC > 0:
+        tasks.append(asyncio.create_task(http_keepalive()))
+    if not DISABLE_WS:
+        tasks.append(asyncio.create_task(ws_consume()))
+    return tasks
 
-def run_flask():
-    port = int(os.getenv("PORT", "8080"))
-    app.run(host="0.0.0.0", port=port, debug=False)
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    tasks = start_background_tasks()
+    try:
+        yield
+    finally:
+        # RPC 批次器是第一次查詢時才懶啟動的，不在 tasks 裡：一併取消，等全部收尾後才關 HTTP client
+        if _rpc_batcher_task is not None: tasks.append(_rpc_batcher_task)
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await http_shutdown()
+        seen_store_close()
 
-# =========================== Start ===========================
-loop = asyncio.new_event_loop()
+app = Starlette(routes=[
+    Route("/healthz", healthz, methods=["GET"]),
+    Route("/stats", stats, methods=["GET"]),
+    Route("/helius", helius_hook, methods=["POST"]),
+], lifespan=lifespan)
 
-def start_async_loop():
-    asyncio.set_event_loop(loop)
-    focus = set(PROGRAM_IDS)
-    loop.create_task(process_worker(focus))
-    if not DISABLE_WS:
-        loop.run_until_complete(ws_consume())
-    else:
-        loop.run_forever()
+# =========================== Start ===========================
+# 單一行程：WS 訂閱、佇列與快取都在行程內，多 worker 只會重複訂閱、重複推播
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "uvloop")  # uvloop 不支援 Windows，可設 asyncio
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "httptools")
 
 if __name__ == "__main__":
-    t = threading.Thread(target=start_async_loop, daemon=True)
-    t.start()
-    run_flask()
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8080")),
+                loop=UVICORN_LOOP, http=UVICORN_HTTP)